@@ -0,0 +1,32 @@
+#version 330 core
+
+// Output pass for the video processor (desktop GL only, not used by the web demo).
+// Converts the chroma-keyed RGBA frame to planar BT.709 Y'CbCr + alpha for
+// ProRes 4444 (yuva444p10le): limited range for Y'CbCr, full range for alpha.
+// Each plane goes to its own R16 attachment as a 10-bit code in a 16-bit word.
+
+uniform sampler2D u_keyed;
+
+layout(location = 0) out float outY;
+layout(location = 1) out float outCb;
+layout(location = 2) out float outCr;
+layout(location = 3) out float outA;
+
+// Normalized value an R16 target stores as the given 10-bit code
+float code10(float value) {
+	return floor(clamp(value, 0.0, 1023.0) + 0.5) / 65535.0;
+}
+
+void main() {
+	// Same-size target, so fetch the matching texel directly
+	vec4 rgba = texelFetch(u_keyed, ivec2(gl_FragCoord.xy), 0);
+
+	float y = dot(rgba.rgb, vec3(0.2126, 0.7152, 0.0722));
+	float cb = (rgba.b - y) / 1.8556;
+	float cr = (rgba.r - y) / 1.5748;
+
+	outY = code10(64.0 + 876.0 * y);
+	outCb = code10(512.0 + 896.0 * cb);
+	outCr = code10(512.0 + 896.0 * cr);
+	outA = code10(1023.0 * rgba.a);
+}
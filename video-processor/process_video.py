@@ -6,26 +6,53 @@ Supports: Transparency, Tolerance, Highlight, Shadow, Pedestal, Spill Suppressio
 """
 
 import sys
+import re
+import hashlib
+import colorsys
 import cv2
 import numpy as np
 from pathlib import Path
 from OpenGL.GL import *
 from OpenGL.GL import shaders
+from OpenGL.error import GLError
 import glfw
 import subprocess
-import shutil
+import threading
+import av
+from fractions import Fraction
+import queue
 import time
+import math
 
 
 class ChromaKeyProcessor:
-    def __init__(self, width, height):
+    def __init__(self, width, height, shader_cache_dir=None):
         self.width = width
         self.height = height
+        self.shader_cache_dir = Path(shader_cache_dir) if shader_cache_dir else None
         self.window = None
         self.program = None
+        self.matte_program = None
+        self.output_program = None
         self.vao = None
+        self.fbos = {}
+        self.renderbuffers = None
         self.textures = {}
         self.uniforms = {}
+        self.output_uniforms = {}
+        self.ubo = None
+        self.params_layout = []
+        self.params_size = 0
+        self.params_data = None
+        self.needs_matte = False
+        self.pbos = None
+        self.upload_pbos = None
+        self.fences = [None, None]
+        self.can_invalidate = False
+        self.frame_idx = 0
+        # Planar Y, Cb, Cr, A (10-bit codes in uint16), reused for every readback;
+        # callers must consume a frame before the next one
+        self.readback = np.empty((4, height, width), dtype=np.uint16)
         
     def init_gl(self):
         """Initialize OpenGL context with GLFW"""
@@ -46,13 +73,64 @@ class ChromaKeyProcessor:
         
         glfw.make_context_current(self.window)
         
-        # Enable blending for transparency
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.setup_framebuffers()
+        
+        # No blending: the full-screen quad's output is the frame, alpha included
+        glDisable(GL_BLEND)
+        # Entry points can resolve on drivers whose context is older, so check the version too
+        gl_version = (glGetIntegerv(GL_MAJOR_VERSION), glGetIntegerv(GL_MINOR_VERSION))
+        self.can_invalidate = gl_version >= (4, 3) and bool(glInvalidateFramebuffer)
         
         print(f"OpenGL Version: {glGetString(GL_VERSION).decode()}")
         print(f"GLSL Version: {glGetString(GL_SHADING_LANGUAGE_VERSION).decode()}")
         
+    def setup_framebuffers(self):
+        """Setup offscreen framebuffers for the matte, chroma key and YUVA output passes"""
+        # Matte pass stores the raw key alpha once per pixel for the choke/soften taps.
+        # 8-bit is enough: the keyed RGBA8 target quantizes alpha to 8 bits anyway
+        matte = self.create_texture('matte')
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_R8, self.width, self.height,
+                     0, GL_RED, GL_UNSIGNED_BYTE, None)
+        
+        self.fbos['matte'] = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbos['matte'])
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, matte, 0)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise Exception("Matte framebuffer is incomplete")
+        
+        # The matte is only ever sampled from unit 2, so bind it there once
+        glActiveTexture(GL_TEXTURE2)
+        glBindTexture(GL_TEXTURE_2D, matte)
+        glActiveTexture(GL_TEXTURE0)
+        
+        # Chroma key pass renders into an RGBA8 texture the output pass samples
+        keyed = self.create_texture('keyed')
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.width, self.height,
+                     0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        
+        self.fbos['key'] = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbos['key'])
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, keyed, 0)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise Exception("Chroma key framebuffer is incomplete")
+        
+        # Output pass writes Y, Cb, Cr, A to one R16 renderbuffer each, so
+        # readback is already planar yuva444p10le
+        self.renderbuffers = glGenRenderbuffers(4)
+        self.fbos['yuva'] = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbos['yuva'])
+        for i, rbo in enumerate(self.renderbuffers):
+            glBindRenderbuffer(GL_RENDERBUFFER, rbo)
+            glRenderbufferStorage(GL_RENDERBUFFER, GL_R16, self.width, self.height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0 + i, GL_RENDERBUFFER, rbo)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        glDrawBuffers(4, [GL_COLOR_ATTACHMENT0 + i for i in range(4)])
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise Exception("YUVA output framebuffer is incomplete")
+        
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(0, 0, self.width, self.height)
+    
     def load_shaders(self, vert_path, frag_path):
         """Load and compile shaders"""
         with open(vert_path, 'r') as f:
@@ -64,20 +142,153 @@ class ChromaKeyProcessor:
         # Convert GLSL ES to GLSL 3.3
         vert_source = self._convert_vertex_shader(vert_source)
         frag_source = self._convert_fragment_shader(frag_source)
+        frag_source = self._convert_video_sampler(frag_source)
+        frag_source = self._convert_key_color(frag_source)
+        frag_source, self.params_layout = self._convert_params_block(frag_source)
+        
+        self.program = self._link_program(vert_source, self._convert_matte_taps(frag_source))
+        self.matte_program = self._link_program(vert_source, self._convert_matte_pass(frag_source))
+        
+        # Get uniform locations (samplers are fixed to texture units 0/1/2 once)
+        glUseProgram(self.program)
+        self.uniforms = {
+            'u_videoY': glGetUniformLocation(self.program, 'u_videoY'),
+            'u_videoUV': glGetUniformLocation(self.program, 'u_videoUV'),
+            'u_matte': glGetUniformLocation(self.program, 'u_matte'),
+        }
+        glUniform1i(self.uniforms['u_videoY'], 0)
+        glUniform1i(self.uniforms['u_videoUV'], 1)
+        glUniform1i(self.uniforms['u_matte'], 2)
+        
+        glUseProgram(self.matte_program)
+        glUniform1i(glGetUniformLocation(self.matte_program, 'u_videoY'), 0)
+        glUniform1i(glGetUniformLocation(self.matte_program, 'u_videoUV'), 1)
+        
+        # Until the input's tags are known, decode as BT.709 limited range
+        self.set_video_colorspace(1, 1)
+        
+        # Slider parameters live in one uniform buffer bound at binding point 0
+        # (last member offset plus a vec4 slot covers it, std140 rounds to 16)
+        self.params_size = (self.params_layout[-1][2] + 16 + 15) // 16 * 16
+        for program in (self.program, self.matte_program):
+            glUniformBlockBinding(program, glGetUniformBlockIndex(program, 'Params'), 0)
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.params_size, None, GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, 0, self.ubo)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        self.params_data = None
+        
+    def load_output_shader(self, vert_path, frag_path):
+        """Load and compile the YUVA output pass (fragment shader is already GLSL 3.3)"""
+        with open(vert_path, 'r') as f:
+            vert_source = f.read()
+        
+        with open(frag_path, 'r') as f:
+            frag_source = f.read()
+        
+        vert_source = self._convert_vertex_shader(vert_source)
+        
+        self.output_program = self._link_program(vert_source, frag_source)
+        
+        glUseProgram(self.output_program)
+        self.output_uniforms = {
+            'u_keyed': glGetUniformLocation(self.output_program, 'u_keyed'),
+        }
+        glUniform1i(self.output_uniforms['u_keyed'], 0)
+    
+    def _link_program(self, vert_source, frag_source):
+        """Compile and link a vertex/fragment shader pair (via the program binary cache if possible)"""
+        cache_path = self._program_cache_path(vert_source, frag_source)
+        if cache_path is not None:
+            program = self._load_program_binary(cache_path)
+            if program is not None:
+                return program
+        
+        program = self._compile_program(vert_source, frag_source, retrievable=cache_path is not None)
+        
+        if cache_path is not None:
+            self._save_program_binary(program, cache_path)
+        return program
+    
+    def _program_cache_path(self, vert_source, frag_source):
+        """Cache file for a program, keyed on its sources and the driver; None if caching is unavailable"""
+        if self.shader_cache_dir is None or not bool(glProgramBinary):
+            return None
+        if glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) == 0:
+            return None
+        
+        # Binaries are only valid for the exact driver that produced them
+        key = hashlib.sha256()
+        for part in (glGetString(GL_VENDOR), glGetString(GL_RENDERER), glGetString(GL_VERSION)):
+            key.update(part or b'')
+        key.update(vert_source.encode())
+        key.update(frag_source.encode())
+        return self.shader_cache_dir / f"{key.hexdigest()}.bin"
+    
+    def _load_program_binary(self, cache_path):
+        """Create a program from a cached binary, or None if missing/rejected by the driver"""
+        if not cache_path.exists():
+            return None
+        
+        try:
+            data = cache_path.read_bytes()
+        except OSError as e:
+            print(f"Could not read shader cache {cache_path}: {e}")
+            return None
+        if len(data) <= 4:
+            # Truncated file: recompile and overwrite
+            return None
+        binary_format = int.from_bytes(data[:4], 'little')
+        binary = data[4:]
+        
+        program = glCreateProgram()
+        try:
+            glProgramBinary(program, binary_format, binary, len(binary))
+        except GLError:
+            # Unknown binary format (GL_INVALID_ENUM): recompile and overwrite
+            glDeleteProgram(program)
+            return None
+        if not glGetProgramiv(program, GL_LINK_STATUS):
+            # Driver update or corrupt file: recompile and overwrite
+            glDeleteProgram(program)
+            return None
+        return program
+    
+    def _save_program_binary(self, program, cache_path):
+        """Write a linked program's binary to the cache (best effort)"""
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if not length:
+            return
+        
+        binary = (ctypes.c_ubyte * length)()
+        binary_format = (GLenum * 1)()
+        written = (GLsizei * 1)()
+        glGetProgramBinary(program, length, written, binary_format, binary)
         
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_bytes(int(binary_format[0]).to_bytes(4, 'little') + bytes(binary[:written[0]]))
+        except OSError as e:
+            print(f"Could not write shader cache {cache_path}: {e}")
+    
+    def _compile_program(self, vert_source, frag_source, retrievable=False):
+        """Compile and link a vertex/fragment shader pair from source"""
         try:
             vertex_shader = shaders.compileShader(vert_source, GL_VERTEX_SHADER)
             fragment_shader = shaders.compileShader(frag_source, GL_FRAGMENT_SHADER)
             
             # Manually link program without validation (VAO binding issue on macOS)
-            self.program = glCreateProgram()
-            glAttachShader(self.program, vertex_shader)
-            glAttachShader(self.program, fragment_shader)
-            glLinkProgram(self.program)
+            program = glCreateProgram()
+            glAttachShader(program, vertex_shader)
+            glAttachShader(program, fragment_shader)
+            if retrievable:
+                glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+            glLinkProgram(program)
             
             # Check link status
-            if not glGetProgramiv(self.program, GL_LINK_STATUS):
-                error = glGetProgramInfoLog(self.program).decode()
+            if not glGetProgramiv(program, GL_LINK_STATUS):
+                error = glGetProgramInfoLog(program).decode()
                 raise RuntimeError(f"Program link error: {error}")
             
             # Clean up shaders (they're now in the program)
@@ -88,25 +299,8 @@ class ChromaKeyProcessor:
             print("Shader compilation error:", e)
             raise
         
-        # Get uniform locations
-        glUseProgram(self.program)
-        self.uniforms = {
-            'u_video': glGetUniformLocation(self.program, 'u_video'),
-            'u_resolution': glGetUniformLocation(self.program, 'u_resolution'),
-            'u_keyColor': glGetUniformLocation(self.program, 'u_keyColor'),
-            'u_transparency': glGetUniformLocation(self.program, 'u_transparency'),
-            'u_tolerance': glGetUniformLocation(self.program, 'u_tolerance'),
-            'u_highlight': glGetUniformLocation(self.program, 'u_highlight'),
-            'u_shadow': glGetUniformLocation(self.program, 'u_shadow'),
-            'u_pedestal': glGetUniformLocation(self.program, 'u_pedestal'),
-            'u_spillSuppression': glGetUniformLocation(self.program, 'u_spillSuppression'),
-            'u_contrast': glGetUniformLocation(self.program, 'u_contrast'),
-            'u_midPoint': glGetUniformLocation(self.program, 'u_midPoint'),
-            'u_choke': glGetUniformLocation(self.program, 'u_choke'),
-            'u_soften': glGetUniformLocation(self.program, 'u_soften'),
-            'u_outputMode': glGetUniformLocation(self.program, 'u_outputMode'),
-        }
-        
+        return program
+    
     def _convert_vertex_shader(self, source):
         """Convert GLSL ES to GLSL 3.3"""
         source = source.replace('attribute', 'in')
@@ -134,17 +328,186 @@ class ChromaKeyProcessor:
         
         return '#version 330 core\n' + source
     
+    def _convert_video_sampler(self, source):
+        """Replace the RGB video sampler with NV12 Y/UV samplers and a YUV->RGB lookup
+        
+        Decoded frames stay in their native NV12 layout and are converted per
+        texel in the shader, with the matrix and range from set_video_colorspace().
+        """
+        source = source.replace('uniform sampler2D u_video;', """uniform sampler2D u_videoY;
+uniform sampler2D u_videoUV;
+uniform mat4 u_yuvToRgb;
+
+vec4 sampleVideo(vec2 uv) {
+	vec4 yuv = vec4(texture(u_videoY, uv).r, texture(u_videoUV, uv).rg, 1.0);
+	return vec4(clamp((u_yuvToRgb * yuv).rgb, 0.0, 1.0), 1.0);
+}""")
+        return source.replace('texture(u_video, ', 'sampleVideo(')
+    
+    def _convert_key_color(self, source):
+        """Use a CPU-precomputed HSV key color instead of rgb2hsv(u_keyColor) per sample
+        
+        The key color is constant, but chromaKey() converts it for every tap of
+        the choke/soften kernels.
+        """
+        source = source.replace('uniform vec3 u_keyColor;', 'uniform vec3 u_keyColor;\nuniform vec3 u_keyHSV;')
+        return source.replace('rgb2hsv(u_keyColor)', 'u_keyHSV')
+    
+    def _convert_matte_taps(self, source):
+        """Make choke/soften taps read the precomputed matte instead of re-keying
+        
+        Each tap used to sample the video and run the full chromaKey() again;
+        now it is a single fetch from the matte pass output.
+        """
+        source = source.replace('uniform sampler2D u_videoUV;', 'uniform sampler2D u_videoUV;\nuniform sampler2D u_matte;')
+        tap = re.compile(
+            r'vec4 sampleColor = sampleVideo\(([^;]*)\);\s*'
+            r'float sampleLuma = [^;]*;\s*'
+            r'float sampleAlpha = chromaKey\(sampleColor\.rgb, sampleLuma\);'
+        )
+        return tap.sub(r'float sampleAlpha = texture(u_matte, \1).r;', source)
+    
+    def _convert_matte_pass(self, source):
+        """Build the matte pass: same shader, but main() only writes the raw key alpha"""
+        source = source.replace('void main()', 'void keyMain()')
+        return source + """
+
+void main() {
+	vec4 videoColor = sampleVideo(v_texCoord);
+	float luma = dot(videoColor.rgb, vec3(0.299, 0.587, 0.114));
+	fragColor = vec4(chromaKey(videoColor.rgb, luma));
+}
+"""
+    
+    def _convert_params_block(self, source):
+        """Move plain (non-sampler) uniforms into a std140 uniform block
+        
+        The block has no instance name, so the shader body keeps using the
+        original uniform names. Returns the new source and a list of
+        (name, type, offset) for packing the block on the CPU.
+        """
+        # std140 base alignment and size for the scalar/vector types used
+        std140 = {'float': (4, 4), 'int': (4, 4), 'vec2': (8, 8), 'vec3': (16, 12), 'vec4': (16, 16)}
+        pattern = re.compile(r'^\s*uniform\s+(?:(?:lowp|mediump|highp)\s+)?(float|int|vec2|vec3|vec4)\s+(\w+)\s*;')
+        
+        lines = source.split('\n')
+        layout = []
+        members = []
+        insert_idx = None
+        offset = 0
+        for i, line in enumerate(lines):
+            match = pattern.match(line)
+            if not match:
+                continue
+            glsl_type, name = match.groups()
+            align, size = std140[glsl_type]
+            offset = (offset + align - 1) // align * align
+            layout.append((name, glsl_type, offset))
+            members.append(f'\t{glsl_type} {name};')
+            offset += size
+            lines[i] = None
+            if insert_idx is None:
+                insert_idx = i
+        
+        if insert_idx is None:
+            return source, layout
+        
+        lines[insert_idx] = '\n'.join(['layout(std140) uniform Params {'] + members + ['};'])
+        return '\n'.join(line for line in lines if line is not None), layout
+    
+    def set_video_colorspace(self, colorspace, color_range):
+        """Set the YUV->RGB conversion sampleVideo() uses
+        
+        Takes the AVColorSpace/AVColorRange values PyAV reports on decoded
+        frames. Untagged video is assumed BT.601 below 720 lines, BT.709 above.
+        """
+        # Kr, Kb by AVColorSpace: BT.709, FCC, BT.470BG, SMPTE 170M, SMPTE 240M, BT.2020
+        coefficients = {
+            1: (0.2126, 0.0722), 4: (0.30, 0.11), 5: (0.299, 0.114), 6: (0.299, 0.114),
+            7: (0.212, 0.087), 9: (0.2627, 0.0593), 10: (0.2627, 0.0593),
+        }
+        default = coefficients[1] if self.height >= 720 else coefficients[6]
+        kr, kb = coefficients.get(int(colorspace), default)
+        kg = 1.0 - kr - kb
+        ycbcr_to_rgb = np.array([
+            [1.0, 0.0, 2.0 * (1.0 - kr)],
+            [1.0, -2.0 * kb * (1.0 - kb) / kg, -2.0 * kr * (1.0 - kr) / kg],
+            [1.0, 2.0 * (1.0 - kb), 0.0],
+        ])
+        
+        # Texels are 8-bit codes normalized to 0-1
+        if int(color_range) == 2:  # AVCOL_RANGE_JPEG (full range)
+            offset = np.array([0.0, 128.0, 128.0]) / 255.0
+            scale = np.array([1.0, 1.0, 1.0])
+        else:
+            offset = np.array([16.0, 128.0, 128.0]) / 255.0
+            scale = np.array([255.0 / 219.0, 255.0 / 224.0, 255.0 / 224.0])
+        
+        # rgb = M * (yuv - offset) * scale as one affine matrix
+        matrix = np.eye(4, dtype=np.float32)
+        matrix[:3, :3] = ycbcr_to_rgb * scale
+        matrix[:3, 3] = -(ycbcr_to_rgb * scale) @ offset
+        for program in (self.program, self.matte_program):
+            glUseProgram(program)
+            glUniformMatrix4fv(glGetUniformLocation(program, 'u_yuvToRgb'), 1, GL_TRUE, matrix)
+    
+    def set_params(self, key_color, transparency, tolerance,
+                   highlight=50.0, shadow=50.0, pedestal=0.0,
+                   spill_suppression=30.0, contrast=0.0, mid_point=50.0,
+                   choke=0.0, soften=0.0, output_mode=0):
+        """Upload keying parameters (only touches the GPU when they change)"""
+        # Same thresholds the shader uses to skip choke/soften
+        self.needs_matte = abs(choke) > 0.1 or soften > 0.1
+        
+        values = {
+            'u_resolution': (self.width, self.height),
+            'u_keyColor': key_color,
+            'u_keyHSV': colorsys.rgb_to_hsv(*key_color),  # Same convention as rgb2hsv() in the shader
+            'u_transparency': transparency,
+            'u_tolerance': tolerance,
+            'u_highlight': highlight,
+            'u_shadow': shadow,
+            'u_pedestal': pedestal,
+            'u_spillSuppression': spill_suppression,
+            'u_contrast': contrast,
+            'u_midPoint': mid_point,
+            'u_choke': choke,
+            'u_soften': soften,
+            'u_outputMode': output_mode,
+        }
+        
+        data = np.zeros(self.params_size // 4, dtype=np.float32)
+        as_int = data.view(np.int32)
+        for name, glsl_type, offset in self.params_layout:
+            value = values[name]
+            start = offset // 4
+            if glsl_type == 'int':
+                as_int[start] = int(value)
+            elif glsl_type == 'float':
+                data[start] = value
+            else:
+                data[start:start + len(value)] = value
+        
+        if self.params_data is not None and np.array_equal(data, self.params_data):
+            return
+        self.params_data = data
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, data.nbytes, data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+    
     def setup_geometry(self):
         """Setup full-screen quad"""
+        # Texture row 0 (top of the video frame) maps to framebuffer row 0, so
+        # the frame renders upside down relative to GL and reads back top-down
         vertices = np.array([
             # positions   # texCoords
-            -1.0, -1.0,   0.0, 1.0,
-             1.0, -1.0,   1.0, 1.0,
-            -1.0,  1.0,   0.0, 0.0,
+            -1.0, -1.0,   0.0, 0.0,
+             1.0, -1.0,   1.0, 0.0,
+            -1.0,  1.0,   0.0, 1.0,
             
-            -1.0,  1.0,   0.0, 0.0,
-             1.0, -1.0,   1.0, 1.0,
-             1.0,  1.0,   1.0, 0.0,
+            -1.0,  1.0,   0.0, 1.0,
+             1.0, -1.0,   1.0, 0.0,
+             1.0,  1.0,   1.0, 1.0,
         ], dtype=np.float32)
         
         self.vao = glGenVertexArrays(1)
@@ -164,6 +527,26 @@ class ChromaKeyProcessor:
         
         glBindVertexArray(0)
     
+    def setup_readback(self):
+        """Setup ping-pong pixel pack buffers for async readback"""
+        self.pbos = glGenBuffers(2)
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.readback.nbytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        # Planes are 2 bytes/pixel, so drop the default 4-byte row alignment
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    
+    def setup_upload(self):
+        """Setup ping-pong pixel unpack buffers for texture uploads"""
+        self.upload_pbos = glGenBuffers(2)
+        # NV12: full-size Y plus half-size interleaved UV (resized per frame for row padding)
+        frame_bytes = self.width * self.height * 3 // 2
+        for pbo in self.upload_pbos:
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_UNPACK_BUFFER, frame_bytes, None, GL_STREAM_DRAW)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+    
     def create_texture(self, name):
         """Create OpenGL texture"""
         texture = glGenTextures(1)
@@ -175,90 +558,199 @@ class ChromaKeyProcessor:
         self.textures[name] = texture
         return texture
     
-    def load_background(self, bg_path):
-        """Load background image"""
-        bg = cv2.imread(bg_path)
-        if bg is None:
-            raise Exception(f"Failed to load background: {bg_path}")
+    def update_video_texture(self, frame):
+        """Update the Y and UV textures with a new NV12 frame"""
+        uv_width = (self.width + 1) // 2
+        uv_height = (self.height + 1) // 2
+        if 'video_y' not in self.textures:
+            # Allocate storage once; frames are streamed in with glTexSubImage2D.
+            # (glTexStorage2D needs GL 4.2, the context here is 3.3 core)
+            self.create_texture('video_y')
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_R8, self.width, self.height,
+                         0, GL_RED, GL_UNSIGNED_BYTE, None)
+            self.create_texture('video_uv')
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RG8, uv_width, uv_height,
+                         0, GL_RG, GL_UNSIGNED_BYTE, None)
+            # Plane rows are 1-2 bytes/pixel, so drop the default 4-byte row alignment
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
         
-        bg = cv2.cvtColor(bg, cv2.COLOR_BGR2RGBA)
-        bg = cv2.resize(bg, (self.width, self.height))
+        # Stage both planes (with the decoder's row padding) in a PBO; orphan it
+        # first so we never wait on the driver still reading last frame's data
+        y_plane, uv_plane = frame.planes[0], frame.planes[1]
+        frame_bytes = y_plane.buffer_size + uv_plane.buffer_size
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.upload_pbos[self.frame_idx & 1])
+        glBufferData(GL_PIXEL_UNPACK_BUFFER, frame_bytes, None, GL_STREAM_DRAW)
+        mapped = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, frame_bytes,
+                                  GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+        ctypes.memmove(mapped, y_plane.buffer_ptr, y_plane.buffer_size)
+        ctypes.memmove(mapped + y_plane.buffer_size, uv_plane.buffer_ptr, uv_plane.buffer_size)
+        glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
         
-        texture = self.create_texture('background')
-        glBindTexture(GL_TEXTURE_2D, texture)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.width, self.height, 
-                     0, GL_RGBA, GL_UNSIGNED_BYTE, bg)
+        # Upload from the bound PBO, skipping row padding via GL_UNPACK_ROW_LENGTH
+        glPixelStorei(GL_UNPACK_ROW_LENGTH, y_plane.line_size)
+        glBindTexture(GL_TEXTURE_2D, self.textures['video_y'])
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.width, self.height,
+                        GL_RED, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glPixelStorei(GL_UNPACK_ROW_LENGTH, uv_plane.line_size // 2)
+        glBindTexture(GL_TEXTURE_2D, self.textures['video_uv'])
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, uv_width, uv_height,
+                        GL_RG, GL_UNSIGNED_BYTE, ctypes.c_void_p(y_plane.buffer_size))
+        glPixelStorei(GL_UNPACK_ROW_LENGTH, 0)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
     
-    def update_video_texture(self, frame):
-        """Update video texture with new frame"""
-        if 'video' not in self.textures:
-            self.create_texture('video')
-        
-        # Convert BGR to RGBA
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-        
-        glBindTexture(GL_TEXTURE_2D, self.textures['video'])
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.width, self.height,
-                     0, GL_RGBA, GL_UNSIGNED_BYTE, frame)
-    
-    def render_frame(self, key_color, transparency, tolerance, 
-                     highlight=50.0, shadow=50.0, pedestal=0.0, 
-                     spill_suppression=30.0, contrast=0.0, mid_point=50.0,
-                     choke=0.0, soften=0.0, output_mode=0):
-        """Render a frame with current parameters"""
-        # Clear with transparency (alpha = 0)
-        glClearColor(0.0, 0.0, 0.0, 0.0)
-        glClear(GL_COLOR_BUFFER_BIT)
-        glUseProgram(self.program)
-        
-        # Set uniforms
-        glUniform2f(self.uniforms['u_resolution'], self.width, self.height)
-        glUniform3f(self.uniforms['u_keyColor'], key_color[0], key_color[1], key_color[2])
-        glUniform1f(self.uniforms['u_transparency'], transparency)
-        glUniform1f(self.uniforms['u_tolerance'], tolerance)
-        glUniform1f(self.uniforms['u_highlight'], highlight)
-        glUniform1f(self.uniforms['u_shadow'], shadow)
-        glUniform1f(self.uniforms['u_pedestal'], pedestal)
-        glUniform1f(self.uniforms['u_spillSuppression'], spill_suppression)
-        glUniform1f(self.uniforms['u_contrast'], contrast)
-        glUniform1f(self.uniforms['u_midPoint'], mid_point)
-        glUniform1f(self.uniforms['u_choke'], choke)
-        glUniform1f(self.uniforms['u_soften'], soften)
-        glUniform1i(self.uniforms['u_outputMode'], output_mode)
-        
-        # Bind video texture
+    def render_frame(self):
+        """Render a frame with the parameters last passed to set_params"""
+        # Bind video planes (parameters come from the uniform buffer)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.textures['video_uv'])
         glActiveTexture(GL_TEXTURE0)
-        glBindTexture(GL_TEXTURE_2D, self.textures['video'])
-        glUniform1i(self.uniforms['u_video'], 0)
-        
-        # Draw
+        glBindTexture(GL_TEXTURE_2D, self.textures['video_y'])
         glBindVertexArray(self.vao)
+        
+        # Pass 0: raw key alpha, only needed when choke/soften sample neighbours
+        if self.needs_matte:
+            glBindFramebuffer(GL_FRAMEBUFFER, self.fbos['matte'])
+            if self.can_invalidate:
+                glInvalidateFramebuffer(GL_FRAMEBUFFER, 1, [GL_COLOR_ATTACHMENT0])
+            glUseProgram(self.matte_program)
+            glDrawArrays(GL_TRIANGLES, 0, 6)
+        
+        # Pass 1: chroma key into the RGBA8 texture
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbos['key'])
+        
+        # No clear: the quad overwrites every pixel. Where supported (GL 4.3+),
+        # tell the driver the old contents are dead instead of writing them
+        if self.can_invalidate:
+            glInvalidateFramebuffer(GL_FRAMEBUFFER, 1, [GL_COLOR_ATTACHMENT0])
+        glUseProgram(self.program)
+        glDrawArrays(GL_TRIANGLES, 0, 6)
+        
+        # Pass 2: convert to planar 10-bit YUVA (replaces FFmpeg's CPU swscale)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbos['yuva'])
+        glUseProgram(self.output_program)
+        glBindTexture(GL_TEXTURE_2D, self.textures['keyed'])
         glDrawArrays(GL_TRIANGLES, 0, 6)
         glBindVertexArray(0)
         
-        # Read pixels with alpha channel
-        pixels = glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
-        image = np.frombuffer(pixels, dtype=np.uint8).reshape(self.height, self.width, 4)
+        # Start async readback of all four planes into the current PBO and fence it
+        index = self.frame_idx % 2
+        plane_bytes = self.width * self.height * 2
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[index])
+        for plane in range(4):
+            glReadBuffer(GL_COLOR_ATTACHMENT0 + plane)
+            glReadPixels(0, 0, self.width, self.height, GL_RED, GL_UNSIGNED_SHORT,
+                         ctypes.c_void_p(plane * plane_bytes))
+        self.fences[index] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.frame_idx += 1
         
-        # Flip vertically (OpenGL coordinates)
-        image = np.flipud(image)
+        # First frame: nothing to hand back yet
+        if self.frame_idx == 1:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            return None
+        
+        # Hand back the previous frame while the GPU works on this one
+        return self._map_readback(self.frame_idx % 2)
+    
+    def drain_frame(self):
+        """Return the last frame still pending in a PBO (call once after the final render_frame)"""
+        if self.frame_idx == 0:
+            return None
+        return self._map_readback((self.frame_idx - 1) % 2)
+    
+    def _wait_fence(self, index, timeout_ns=1_000_000_000, retries=10):
+        """Block until the GPU has signaled the fence for a readback slot"""
+        fence = self.fences[index]
+        if fence is None:
+            return
+        
+        # First wait flushes so the fence is guaranteed to make progress
+        flags = GL_SYNC_FLUSH_COMMANDS_BIT
+        for _ in range(retries):
+            result = glClientWaitSync(fence, flags, timeout_ns)
+            if result in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+                break
+            if result == GL_WAIT_FAILED:
+                raise RuntimeError("glClientWaitSync failed while waiting for readback")
+            flags = 0
+        else:
+            # A lost or hung GPU would otherwise stall here forever
+            raise RuntimeError(
+                f"Readback fence not signaled after {retries * timeout_ns / 1e9:.0f}s; GPU may be hung")
         
-        # Keep RGBA for transparency
-        return image
+        glDeleteSync(fence)
+        self.fences[index] = None
+    
+    def _map_readback(self, index):
+        """Copy a finished readback out of a PBO"""
+        self._wait_fence(index)
+        
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[index])
+        mapped = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.readback.nbytes, GL_MAP_READ_BIT)
+        ctypes.memmove(self.readback.ctypes.data, mapped, self.readback.nbytes)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        
+        # Rows are already top-down (see setup_geometry)
+        return self.readback
     
     def cleanup(self):
         """Cleanup OpenGL resources"""
         if self.vao:
             glDeleteVertexArrays(1, [self.vao])
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        if self.pbos is not None:
+            glDeleteBuffers(2, self.pbos)
+        for fbo in self.fbos.values():
+            glDeleteFramebuffers(1, [fbo])
+        if self.renderbuffers is not None:
+            glDeleteRenderbuffers(4, self.renderbuffers)
+        if self.upload_pbos is not None:
+            glDeleteBuffers(2, self.upload_pbos)
+        if self.ubo:
+            glDeleteBuffers(1, [self.ubo])
         for texture in self.textures.values():
             glDeleteTextures(1, [texture])
         if self.program:
             glDeleteProgram(self.program)
+        if self.matte_program:
+            glDeleteProgram(self.matte_program)
+        if self.output_program:
+            glDeleteProgram(self.output_program)
         if self.window:
             glfw.destroy_window(self.window)
         glfw.terminate()
 
 
+def open_input(input_path):
+    """Open the input video, decoding on the GPU (NVDEC/VideoToolbox) when available"""
+    device_type = 'videotoolbox' if sys.platform == 'darwin' else 'cuda'
+    try:
+        from av.codec.hwaccel import HWAccel
+        container = av.open(input_path, hwaccel=HWAccel(device_type=device_type,
+                                                        allow_software_fallback=True))
+        print(f"Decoder: {device_type} hardware acceleration (software fallback enabled)")
+    except Exception as e:
+        # PyAV without hwaccel support, or no such device on this machine
+        print(f"Decoder: software ({e})")
+        container = av.open(input_path)
+    return container
+
+
+def yuva_to_bgra(planes):
+    """Convert planar 10-bit BT.709 Y'CbCrA back to 8-bit BGRA (debug PNG tap)"""
+    y = (planes[0].astype(np.float32) - 64.0) / 876.0
+    cb = (planes[1].astype(np.float32) - 512.0) / 896.0
+    cr = (planes[2].astype(np.float32) - 512.0) / 896.0
+    r = y + 1.5748 * cr
+    b = y + 1.8556 * cb
+    g = (y - 0.2126 * r - 0.0722 * b) / 0.7152
+    a = planes[3].astype(np.float32) / 1023.0
+    bgra = np.stack([b, g, r, a], axis=-1)
+    return (np.clip(bgra, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
 def process_video(input_path, output_path, 
                   key_color=(0.157, 0.576, 0.129),
                   transparency=50.0,
@@ -291,15 +783,20 @@ def process_video(input_path, output_path,
         choke: -20 to 20, negative=expand, positive=shrink matte
         soften: 0-20, blur amount for edges
         output_mode: 0=Composite (with transparency), 1=Alpha Channel, 2=Status
-        keep_frames: If True, preserve PNG frames for inspection
+        keep_frames: If True, also dump PNG frames for inspection (slow, debug only)
     """
     
     # Start performance tracking
-    perf_start = time.time()
+    perf_start = time.perf_counter()
     perf_stats = {
         'init_time': 0,
-        'frame_times': [],
-        'ffmpeg_time': 0,
+        # Running frame-time accumulators (no per-frame list for long videos)
+        'count': 0,
+        'sum': 0.0,
+        'sum_sq': 0.0,
+        'min': math.inf,
+        'max': 0.0,
+        'encode_flush_time': 0,
         'total_frames': 0
     }
     
@@ -318,25 +815,34 @@ def process_video(input_path, output_path,
     print(f"Output Mode: {output_mode_names.get(output_mode, 'Unknown')}")
     
     # Open input video
-    cap = cv2.VideoCapture(input_path)
-    if not cap.isOpened():
-        raise Exception(f"Failed to open video: {input_path}")
+    try:
+        input_container = open_input(input_path)
+    except av.error.FFmpegError as e:
+        raise Exception(f"Failed to open video: {input_path} ({e})")
+    input_stream = input_container.streams.video[0]
+    input_stream.thread_type = 'AUTO'  # Frame/slice threads for the software path
     
     # Get video properties
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = input_stream.codec_context.width
+    height = input_stream.codec_context.height
+    fps = input_stream.average_rate or input_stream.guessed_rate
+    total_frames = input_stream.frames
+    if not total_frames and input_stream.duration:
+        total_frames = int(input_stream.duration * input_stream.time_base * fps)
     
-    print(f"Video: {width}x{height} @ {fps}fps, {total_frames} frames")
+    print(f"Video: {width}x{height} @ {float(fps):.3f}fps, {total_frames} frames")
     
     # Initialize processor
-    init_start = time.time()
-    processor = ChromaKeyProcessor(width, height)
+    init_start = time.perf_counter()
+    # Linked shader binaries are cached per driver to skip recompiling on the next run
+    shader_cache_dir = Path.home() / '.cache' / 'chroma-key-processor'
+    processor = ChromaKeyProcessor(width, height, shader_cache_dir)
     processor.init_gl()
     
     # Setup geometry BEFORE loading shaders (VAO must exist for validation)
     processor.setup_geometry()
+    processor.setup_upload()
+    processor.setup_readback()
     
     # Load shaders - check if running in Docker (/app) or locally (video-processor/)
     script_dir = Path(__file__).parent
@@ -351,59 +857,193 @@ def process_video(input_path, output_path,
         shader_dir / 'basic.vert',
         shader_dir / 'phase5.frag'
     )
+    processor.load_output_shader(
+        shader_dir / 'basic.vert',
+        shader_dir / 'yuva444.frag'
+    )
     
-    perf_stats['init_time'] = time.time() - init_start
+    # Parameters are constant for the whole video, so upload them once
+    processor.set_params(
+        key_color, transparency, tolerance,
+        highlight, shadow, pedestal, spill_suppression,
+        contrast, mid_point, choke, soften,
+        output_mode
+    )
+    
+    perf_stats['init_time'] = time.perf_counter() - init_start
     print(f"⚡ Initialization time: {perf_stats['init_time']:.2f}s")
     
-    # Create temporary directory for PNG frames
-    import tempfile
-    temp_dir = Path(tempfile.mkdtemp(prefix='chroma_key_'))
-    print(f"Temporary frame directory: {temp_dir}")
+    # Optional debug tap: dump PNG frames alongside the encoded video
+    frames_dir = None
+    if keep_frames:
+        frames_dir = Path(output_path).parent / "frames"
+        frames_dir.mkdir(parents=True, exist_ok=True)
+        print(f"PNG frame directory: {frames_dir}")
+    
+    # Encode in-process with libavcodec via PyAV (no intermediate PNGs, no pipe)
+    # Profile 4 = ProRes 4444 (supports alpha)
+    container = av.open(str(output_path), mode='w')
+    stream = container.add_stream('prores_ks', rate=Fraction(fps).limit_denominator(1001))
+    stream.width = width
+    stream.height = height
+    stream.pix_fmt = 'yuva444p10le'  # 10-bit YUV with alpha
+    # Tag the stream with what yuva444.frag writes (BT.709, limited range);
+    # untagged files are read as BT.601 by swscale-based players. This fills
+    # the MOV colr atom; encoder_writer tags the ProRes frame headers.
+    stream.codec_context.colorspace = 1  # AVCOL_SPC_BT709
+    stream.codec_context.color_primaries = 1  # AVCOL_PRI_BT709
+    stream.codec_context.color_trc = 1  # AVCOL_TRC_BT709
+    stream.codec_context.color_range = 1  # AVCOL_RANGE_MPEG (limited)
+    stream.options = {
+        'profile': '4',  # Profile 4 = ProRes 4444 (WITH alpha support)
+        'vendor': 'apl0',  # Apple vendor code for compatibility
+    }
+    
+    # Encode from a writer thread so libavcodec overlaps with rendering
+    frame_queue = queue.Queue(maxsize=3)
+    writer_errors = []
+    
+    def encoder_writer():
+        try:
+            # Compare by identity: '==' against an ndarray is elementwise
+            while (planes := frame_queue.get()) is not None:
+                # Planes are already yuva444p10le, so hand them over without swscale
+                video_frame = av.VideoFrame(width, height, 'yuva444p10le')
+                # prores_ks writes the frame header's colour bytes from the frame,
+                # not the codec context, so tag every frame as well
+                video_frame.colorspace = 1  # AVCOL_SPC_BT709
+                video_frame.color_primaries = 1  # AVCOL_PRI_BT709
+                video_frame.color_trc = 1  # AVCOL_TRC_BT709
+                video_frame.color_range = 1  # AVCOL_RANGE_MPEG (limited)
+                for plane, data in zip(video_frame.planes, planes):
+                    rows = np.frombuffer(plane, dtype=np.uint16).reshape(plane.height, -1)
+                    rows[:, :width] = data
+                for packet in stream.encode(video_frame):
+                    container.mux(packet)
+        except Exception as e:
+            writer_errors.append(e)
+            # Keep draining so the render loop never blocks on a full queue
+            while frame_queue.get() is not None:
+                pass
+            return
+        
+        # Flush frames still buffered in the encoder; the sentinel is already
+        # consumed here, so a failure must not fall into the drain loop above
+        try:
+            for packet in stream.encode():
+                container.mux(packet)
+        except Exception as e:
+            writer_errors.append(e)
+    
+    writer = threading.Thread(target=encoder_writer, daemon=True)
+    writer.start()
+    
+    frames_written = 0
+    sample_frame_path = Path(output_path).parent / "sample_frame_with_alpha.png"
+    
+    def write_frame(output_frame):
+        """Queue a rendered planar YUVA frame for the encoder (and the optional PNG tap)"""
+        nonlocal frames_written
+        # Copy now: the processor reuses its readback buffer for the next frame
+        frame_queue.put(output_frame.copy())
+        
+        if frames_dir is not None:
+            # cv2.imwrite expects BGRA for PNG with alpha
+            output_bgra = yuva_to_bgra(output_frame)
+            frame_path = frames_dir / f"frame_{frames_written:06d}.png"
+            cv2.imwrite(str(frame_path), output_bgra, [cv2.IMWRITE_PNG_COMPRESSION, 0])
+        
+        # Test: Save a sample PNG to output for inspection
+        if frames_written == 100:
+            cv2.imwrite(str(sample_frame_path), yuva_to_bgra(output_frame))
+            print(f"Sample PNG saved to: {sample_frame_path}")
+            print("You can inspect this PNG file to verify it has transparency")
+        
+        # Debug: Check first frame has alpha
+        if frames_written == 0:
+            print(f"First frame shape: {output_frame.shape}, dtype: {output_frame.dtype}")
+            print(f"Alpha channel range (10-bit): min={output_frame[3].min()}, max={output_frame[3].max()}")
+        
+        frames_written += 1
+    
+    # Decode ahead on a reader thread, keeping up to 8 frames buffered so
+    # decoding overlaps with upload/render instead of serializing with it
+    decode_queue = queue.Queue(maxsize=8)
+    stop_decoding = threading.Event()
+    reader_errors = []
+    source_color = {}
+    
+    def decoder_reader():
+        try:
+            for frame in input_container.decode(input_stream):
+                if stop_decoding.is_set():
+                    break
+                if not source_color:
+                    # Read the tags before reformat(), which does not carry them over
+                    source_color.update(colorspace=frame.colorspace, color_range=frame.color_range)
+                # Hardware decoders download as NV12; software paths may not
+                if frame.format.name != 'nv12':
+                    frame = frame.reformat(format='nv12')
+                decode_queue.put(frame)
+        except Exception as e:
+            reader_errors.append(e)
+        finally:
+            decode_queue.put(None)
     
     print("\nProcessing frames...")
     frame_count = 0
-    frame_processing_start = time.time()
+    frame_processing_start = time.perf_counter()
+    
+    reader = threading.Thread(target=decoder_reader, daemon=True)
+    reader.start()
     
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+        # Compare by identity, like the writer queue (frames must not go through ==)
+        while (frame := decode_queue.get()) is not None:
+            frame_start = time.perf_counter()
             
-            frame_start = time.time()
+            if frame_count == 0:
+                # Decode with the source's own matrix/range (SD is BT.601, phones are often full range)
+                processor.set_video_colorspace(source_color['colorspace'], source_color['color_range'])
+                print(f"Input colorspace: {source_color['colorspace']}, range: {source_color['color_range']}")
             
             # Update texture and render
             processor.update_video_texture(frame)
-            output_frame = processor.render_frame(
-                key_color, transparency, tolerance,
-                highlight, shadow, pedestal, spill_suppression,
-                contrast, mid_point, choke, soften,
-                output_mode
-            )
+            output_frame = processor.render_frame()
             
-            # Write frame as PNG with alpha channel
-            # Convert RGBA to BGRA for OpenCV (cv2.imwrite expects BGRA for PNG with alpha)
-            output_bgra = cv2.cvtColor(output_frame, cv2.COLOR_RGBA2BGRA)
-            frame_path = temp_dir / f"frame_{frame_count:06d}.png"
-            cv2.imwrite(str(frame_path), output_bgra, [cv2.IMWRITE_PNG_COMPRESSION, 0])
+            # Readback lags one frame behind (PBO ping-pong)
+            if output_frame is not None:
+                write_frame(output_frame)
             
-            frame_time = time.time() - frame_start
-            perf_stats['frame_times'].append(frame_time)
-            
-            # Debug: Check first frame has alpha
-            if frame_count == 0:
-                print(f"First frame shape: {output_frame.shape}, dtype: {output_frame.dtype}")
-                print(f"Alpha channel range: min={output_frame[:,:,3].min()}, max={output_frame[:,:,3].max()}")
+            frame_time = time.perf_counter() - frame_start
+            perf_stats['count'] += 1
+            perf_stats['sum'] += frame_time
+            perf_stats['sum_sq'] += frame_time * frame_time
+            if frame_time < perf_stats['min']:
+                perf_stats['min'] = frame_time
+            if frame_time > perf_stats['max']:
+                perf_stats['max'] = frame_time
             
             frame_count += 1
-            if frame_count % 30 == 0:
-                progress = (frame_count / total_frames) * 100
-                avg_fps = frame_count / (time.time() - frame_processing_start)
+            if frame_count % 300 == 0:
+                progress = (frame_count / max(total_frames, frame_count)) * 100
+                avg_fps = frame_count / (time.perf_counter() - frame_processing_start)
                 print(f"Progress: {frame_count}/{total_frames} ({progress:.1f}%) | FPS: {avg_fps:.2f}")
         
+        if reader_errors:
+            raise Exception(f"Failed to decode video: {reader_errors[0]}")
+        
+        # Collect the frame still in flight
+        output_frame = processor.drain_frame()
+        if output_frame is not None:
+            write_frame(output_frame)
+        
         perf_stats['total_frames'] = frame_count
-        frame_processing_time = time.time() - frame_processing_start
-        avg_frame_time = sum(perf_stats['frame_times']) / len(perf_stats['frame_times'])
+        frame_processing_time = time.perf_counter() - frame_processing_start
+        count = max(perf_stats['count'], 1)
+        avg_frame_time = perf_stats['sum'] / count
+        std_frame_time = math.sqrt(max(perf_stats['sum_sq'] / count - avg_frame_time ** 2, 0.0))
+        min_frame_time = perf_stats['min'] if perf_stats['count'] else 0.0
         avg_fps = frame_count / frame_processing_time
         
         print(f"\n✅ Processed {frame_count} frames")
@@ -411,42 +1051,26 @@ def process_video(input_path, output_path,
         print(f"⚡ Average FPS: {avg_fps:.2f}")
         print(f"⚡ Average time per frame: {avg_frame_time*1000:.2f}ms")
         
-        # Test: Save a sample PNG to output for inspection
-        sample_frame_path = Path(output_path).parent / "sample_frame_with_alpha.png"
-        import shutil as sh
-        if (temp_dir / "frame_000100.png").exists():
-            sh.copy(temp_dir / "frame_000100.png", sample_frame_path)
-            print(f"Sample PNG saved to: {sample_frame_path}")
-            print("You can inspect this PNG file to verify it has transparency")
+        if frames_dir is not None:
+            print(f"\n📁 PNG frames preserved in: {frames_dir}")
+            print("   You can inspect these to verify alpha channel exists")
         
-        print(f"\nConverting to ProRes 4444 with alpha...")
-        ffmpeg_start = time.time()
-        
-        # Convert PNG sequence to ProRes 4444 using FFmpeg
-        # Profile 4 = ProRes 4444 (supports alpha)
-        ffmpeg_cmd = [
-            'ffmpeg',
-            '-y',  # Overwrite output file
-            '-framerate', str(fps),
-            '-i', str(temp_dir / 'frame_%06d.png'),
-            '-c:v', 'prores_ks',  # ProRes encoder
-            '-profile:v', '4',  # Profile 4 = ProRes 4444 (WITH alpha support)
-            '-pix_fmt', 'yuva444p10le',  # 10-bit YUV with alpha
-            '-vendor', 'apl0',  # Apple vendor code for compatibility
-            str(output_path)
-        ]
+        print(f"\nFinishing ProRes 4444 encode...")
+        flush_start = time.perf_counter()
         
-        # Run FFmpeg with direct output (no buffering to avoid hang on large videos)
-        result = subprocess.run(ffmpeg_cmd)
+        # Let the writer drain the queue and flush the encoder
+        frame_queue.put(None)
+        writer.join()
+        container.close()
         
-        perf_stats['ffmpeg_time'] = time.time() - ffmpeg_start
+        perf_stats['encode_flush_time'] = time.perf_counter() - flush_start
         
-        if result.returncode != 0:
-            print(f"\nFFmpeg failed with return code {result.returncode}")
+        if writer_errors:
+            print(f"\nEncoding failed: {writer_errors[0]}")
             raise Exception("Failed to create ProRes video")
         
-        print("\n✅ FFmpeg conversion complete!")
-        print(f"⚡ FFmpeg encoding time: {perf_stats['ffmpeg_time']:.2f}s")
+        print("\n✅ ProRes encoding complete!")
+        print(f"⚡ Encoder flush time: {perf_stats['encode_flush_time']:.2f}s")
         
         # Verify the output file has alpha channel using ffprobe
         print("\nVerifying alpha channel in output file...")
@@ -468,7 +1092,7 @@ def process_video(input_path, output_path,
             print("The file may not have transparency encoded properly.")
         
         # Print final performance summary
-        total_time = time.time() - perf_start
+        total_time = time.perf_counter() - perf_start
         
         print("\n" + "=" * 60)
         print("PERFORMANCE SUMMARY")
@@ -476,32 +1100,35 @@ def process_video(input_path, output_path,
         print(f"Total processing time:     {total_time:.2f}s ({total_time/60:.2f}m)")
         print(f"  - Initialization:        {perf_stats['init_time']:.2f}s ({perf_stats['init_time']/total_time*100:.1f}%)")
         print(f"  - Frame processing:      {frame_processing_time:.2f}s ({frame_processing_time/total_time*100:.1f}%)")
-        print(f"  - FFmpeg encoding:       {perf_stats['ffmpeg_time']:.2f}s ({perf_stats['ffmpeg_time']/total_time*100:.1f}%)")
+        print(f"  - Encoder flush:         {perf_stats['encode_flush_time']:.2f}s ({perf_stats['encode_flush_time']/total_time*100:.1f}%)")
         print(f"\nFrame statistics:")
         print(f"  - Total frames:          {perf_stats['total_frames']}")
         print(f"  - Average FPS:           {avg_fps:.2f}")
         print(f"  - Avg time per frame:    {avg_frame_time*1000:.2f}ms")
-        print(f"  - Min frame time:        {min(perf_stats['frame_times'])*1000:.2f}ms")
-        print(f"  - Max frame time:        {max(perf_stats['frame_times'])*1000:.2f}ms")
+        print(f"  - Std dev frame time:    {std_frame_time*1000:.2f}ms")
+        print(f"  - Min frame time:        {min_frame_time*1000:.2f}ms")
+        print(f"  - Max frame time:        {perf_stats['max']*1000:.2f}ms")
         print(f"\nThroughput:                {perf_stats['total_frames']/total_time:.2f} fps (end-to-end)")
         print("=" * 60)
         
         print(f"\n✅ Done! Output saved to: {output_path}")
     
     finally:
-        cap.release()
+        # Stop the reader (unblocking it if the queue is full) before closing the input
+        stop_decoding.set()
+        while reader.is_alive():
+            try:
+                decode_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        input_container.close()
         processor.cleanup()
         
-        # Clean up temporary PNG frames (unless user wants to keep them)
-        if keep_frames:
-            frames_dir = Path(output_path).parent / "frames"
-            shutil.move(str(temp_dir), str(frames_dir))
-            print(f"\n📁 PNG frames preserved in: {frames_dir}")
-            print("   You can inspect these to verify alpha channel exists")
-        else:
-            print("\nCleaning up temporary files...")
-            shutil.rmtree(temp_dir)
-            print("Cleanup complete!")
+        # Make sure the writer and encoder are not left open if processing bailed out early
+        if writer.is_alive():
+            frame_queue.put(None)
+            writer.join()
+            container.close()
 
 
 def main():
@@ -536,7 +1163,7 @@ def main():
     parser.add_argument('--output-mode', type=int, choices=[0, 1, 2], default=0,
                         help='Output mode: 0=Composite, 1=Alpha Channel, 2=Status, default: 0')
     parser.add_argument('--keep-frames', action='store_true',
-                        help='Keep PNG frames for inspection (saved in frames/ directory)')
+                        help='Also dump PNG frames for inspection (saved in frames/ directory, slow)')
     
     args = parser.parse_args()
     